@@ -2,71 +2,157 @@ from __future__ import annotations
 
 import re
 import random
-from typing import Dict, Callable, Optional, List, Union
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Callable, Optional, List, Tuple, Union
 
 from .nodes import Node, TextNode, MacroNode, MultiNode, EnvironmentNode
 
+# The node classes form a closed set: the formatter dispatches on exact
+# ``type(node) is ...`` checks, so subclasses of them are not recognised.
 
 BINARY_OPERATORS = {"+", "-", "*", "/", "=", "<", ">"}
 
+# A binary operator, an inner space, or ")/" / ")(" all mean the formatted
+# expression has to be wrapped before being used as an operand.
+_NEEDS_PARENTHESES_RE = re.compile(
+    "[" + re.escape("".join(sorted(BINARY_OPERATORS))) + r" ]|\)[/(]"
+)
+# Grouping delimiters whose contents never need extra parentheses when the
+# group spans the whole formatted string, with a regex matching either side.
+_GROUPS = {
+    opening: (closing, re.compile(re.escape(opening) + "|" + re.escape(closing)))
+    for opening, closing in (("(", ")"), ("[", "]"), ("{", "}"), ("⌈", "⌉"), ("⌊", "⌋"))
+}
+_TRAILING_LINE_BREAK_RE = re.compile(r"\\\\\s*$")
+_LINE_END_BREAK_RE = re.compile(r"\\\\\s*(?=\s*$)", re.MULTILINE)
+_ALIGNMENT_RE = re.compile(r"\s*&\s*")
+_SPACES_RE = re.compile(r" +")
+# Whitespace after "(" or before ")"; the matched parenthesis is kept.
+_PARENTHESES_SPACING_RE = re.compile(r"(\()\s+|\s+(\))")
+
 
 def _clean_parentheses_spacing(text: str) -> str:
-    text = re.sub(r"\(\s+", "(", text)
-    text = re.sub(r"\s+\)", ")", text)
-    return text
+    return _PARENTHESES_SPACING_RE.sub(r"\1\2", text)
+
+
+# Zero-width positions where _add_spaces inserts a space: before an operator
+# unless it follows a space, an opening bracket, "%" or another operator;
+# after an operator unless a space or closing bracket follows; and between a
+# closing bracket and an alphanumeric character.
+_OPERATOR_CLASS = re.escape("".join(sorted(BINARY_OPERATORS)))
+_OPERATOR_SPACING_RE = re.compile(
+    rf"(?=[{_OPERATOR_CLASS}])(?<=[^ (\[{{%{_OPERATOR_CLASS}])"
+    rf"|(?<=[{_OPERATOR_CLASS}])(?=[^ )\]}}])"
+    r"|(?<=[)\]}])(?=[^\W_])"
+)
+
+
+# The same short operands recur throughout a document, so cache the result.
+@lru_cache(maxsize=4096)
+def _add_spaces(content: str) -> str:
+    if "  " in content:
+        content = _SPACES_RE.sub(" ", content)
+    return _OPERATOR_SPACING_RE.sub(" ", content)
+
+
+class _ConstantFormat:
+    """Formatter for macros that always render to the same string.
+
+    ``Formatter`` reads ``text`` directly instead of calling these, which
+    saves a Python call for the bulk of symbol macros.
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        # Many macros share a symbol; interning keeps one copy of each.
+        self.text = sys.intern(text)
+
+    def __call__(
+        self, node: MacroNode, formatter: Formatter, add_spaces: bool = False
+    ) -> str:
+        return self.text
 
 
 def _simple_format(text: Union[str, List[str]], weights: Optional[List[float]] = None) -> Callable[[MacroNode, Formatter, bool], str]:
+    if isinstance(text, str):
+        return _ConstantFormat(text)
+
     def _simple_format_wrapper(
         node: MacroNode, formatter: Formatter, add_spaces: bool = False
     ) -> str:
-        if isinstance(text, str):
-            return text
-        else:
-            return random.choices(text, weights=weights or [1] * len(text))[0]
+        return random.choices(text, weights=weights or [1] * len(text))[0]
 
     return _simple_format_wrapper
 
 
-def _needs_parentheses(formatted_string: str) -> bool:
-    if not formatted_string:
+def _is_wrapped_in_group(formatted_string: str) -> bool:
+    group = _GROUPS.get(formatted_string[0])
+    if group is None:
+        return False
+    opening = formatted_string[0]
+    closing, delimiters = group
+    if not formatted_string.endswith(closing):
+        return False
+
+    # A wrapping pair implies balanced counts, and a single pair is the wrapper.
+    count = formatted_string.count(opening)
+    if count != formatted_string.count(closing):
         return False
+    if count == 1:
+        return True
 
-    if formatted_string.startswith("(") and formatted_string.endswith(")"):
-        paren_count = 0
-        for i, char in enumerate(formatted_string):
-            if char == "(":
-                paren_count += 1
-            elif char == ")":
-                paren_count -= 1
-                if paren_count == 0 and i < len(formatted_string) - 1:
-                    break
+    # Jump between delimiters only; the text in between is skipped in C.
+    depth = 0
+    for match in delimiters.finditer(formatted_string):
+        if match.group() == opening:
+            depth += 1
         else:
-            if paren_count == 0:
-                return False
+            depth -= 1
+            if depth == 0:
+                return match.end() == len(formatted_string)
+    return False
 
-    for op in BINARY_OPERATORS:
-        if op in formatted_string:
-            return True
 
-    if " " in formatted_string.strip():
-        return True
+@lru_cache(maxsize=4096)
+def _needs_parentheses(formatted_string: str) -> bool:
+    if not formatted_string:
+        return False
 
-    if ")/" in formatted_string or ")(" in formatted_string:
-        return True
+    # A string that is one bracketed group already reads as a single operand.
+    if _is_wrapped_in_group(formatted_string):
+        return False
+
+    return _NEEDS_PARENTHESES_RE.search(formatted_string.strip()) is not None
 
-    return False
+
+def _argument_needs_parentheses(argument: Node, formatted_string: str) -> bool:
+    # A bare single letter or digit never needs wrapping, so skip the scan.
+    if (
+        type(argument) is TextNode
+        and len(argument.content) == 1
+        and argument.content.isalnum()
+        and argument.subscript is None
+        and argument.superscript is None
+    ):
+        return False
+    return _needs_parentheses(formatted_string)
 
 
 def _format_sqrt(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
+    args = node.arguments
+    optional_args = node.optional_arguments
     power_character = random.choice(["^", "**"])
 
-    if node.optional_arguments:
-        root_index = node.optional_arguments[0]
-        if node.arguments and node.arguments[0] is not None:
-            formatted_arg = formatter._format_node(node.arguments[0], add_spaces)
+    if optional_args:
+        root_index = optional_args[0]
+        if args and args[0] is not None:
+            formatted_arg = formatter._format_node(args[0], add_spaces)
             fraq_variant = random.choice([0, 1])
 
             try:
@@ -76,55 +162,63 @@ def _format_sqrt(
                 is_number = False
             
             if fraq_variant == 0 and is_number and len(str(1 / int(root_index)).split(".")[1]) <= 5:
-                if _needs_parentheses(formatted_arg):
+                if _argument_needs_parentheses(args[0], formatted_arg):
                     return f"({formatted_arg}){power_character}{str(1 / int(root_index))}"
                 else:
                     return f"{formatted_arg}{power_character}{str(1 / int(root_index))}"
             else:
-                if _needs_parentheses(formatted_arg):
+                if _argument_needs_parentheses(args[0], formatted_arg):
                     return f"({formatted_arg})^{power_character}(1/{root_index})"
                 else:
                     return f"{formatted_arg}^{power_character}(1/{root_index})"
         else:
             return f"x{power_character}(1/{root_index})"
     else:
-        if node.arguments and node.arguments[0] is not None:
-            formatted_arg = formatter._format_node(node.arguments[0], add_spaces)
+        if args and args[0] is not None:
+            formatted_arg = formatter._format_node(args[0], add_spaces)
             sqrt_variant = random.choice([0, 1, 2, 3])
             if sqrt_variant == 0:
-                if _needs_parentheses(formatted_arg):
-                    return f"√({formatted_arg})"
+                if _argument_needs_parentheses(args[0], formatted_arg):
+                    return "√(" + formatted_arg + ")"
                 else:
-                    return f"√{formatted_arg}"
+                    return "√" + formatted_arg
             elif sqrt_variant == 1:
-                if _needs_parentheses(formatted_arg):
+                if _argument_needs_parentheses(args[0], formatted_arg):
                     return f"({formatted_arg}){power_character}0.5"
                 else:
                     return f"{formatted_arg}{power_character}0.5"
             elif sqrt_variant == 2:
-                if _needs_parentheses(formatted_arg):
+                if _argument_needs_parentheses(args[0], formatted_arg):
                     return f"({formatted_arg}){power_character}(1/2)"
                 else:
                     return f"{formatted_arg}{power_character}(1/2)"
             elif sqrt_variant == 3:
-                return f"sqrt({formatted_arg})"
+                return "sqrt(" + formatted_arg + ")"
         else:
             return ""
 
 
-def _format_frac(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
+def _join_fraction(
+    numerator_arg: Node, numerator: str, denominator_arg: Node, denominator: str
 ) -> str:
-    if node.arguments and len(node.arguments) >= 2:
-        numerator = formatter._format_node(node.arguments[0], add_spaces)
-        denominator = formatter._format_node(node.arguments[1], add_spaces)
+    # One interpolation per branch, so no intermediate wrapped strings.
+    if _argument_needs_parentheses(numerator_arg, numerator):
+        if _argument_needs_parentheses(denominator_arg, denominator):
+            return f"({numerator})/({denominator})"
+        return f"({numerator})/{denominator}"
+    if _argument_needs_parentheses(denominator_arg, denominator):
+        return f"{numerator}/({denominator})"
+    return f"{numerator}/{denominator}"
 
-        if _needs_parentheses(numerator):
-            numerator = f"({numerator})"
-        if _needs_parentheses(denominator):
-            denominator = f"({denominator})"
 
-        result = f"{numerator}/{denominator}"
+def _format_frac(
+    node: MacroNode, formatter: Formatter, add_spaces: bool = False
+) -> str:
+    args = node.arguments
+    if args and len(args) >= 2:
+        numerator = formatter._format_node(args[0], add_spaces)
+        denominator = formatter._format_node(args[1], add_spaces)
+        result = _join_fraction(args[0], numerator, args[1], denominator)
         if add_spaces:
             result = formatter._add_spaces_to_content(result)
         return result
@@ -135,20 +229,16 @@ def _format_frac(
 def _format_genfrac(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
-    if node.arguments and len(node.arguments) >= 6:
-        numerator = formatter._format_node(node.arguments[4], add_spaces)
-        denominator = formatter._format_node(node.arguments[5], add_spaces)
-        ldelim = formatter._format_node(node.arguments[0], add_spaces)
-        rdelim = formatter._format_node(node.arguments[1], add_spaces)
-
-        if _needs_parentheses(numerator):
-            numerator = f"({numerator})"
-        if _needs_parentheses(denominator):
-            denominator = f"({denominator})"
-
-        result = f"{numerator}/{denominator}"
+    args = node.arguments
+    if args and len(args) >= 6:
+        numerator = formatter._format_node(args[4], add_spaces)
+        denominator = formatter._format_node(args[5], add_spaces)
+        ldelim = formatter._format_node(args[0], add_spaces)
+        rdelim = formatter._format_node(args[1], add_spaces)
+
+        result = _join_fraction(args[4], numerator, args[5], denominator)
         if ldelim or rdelim:
-            result = f"{ldelim}{result}{rdelim}"
+            result = ldelim + result + rdelim
 
         if add_spaces:
             result = formatter._add_spaces_to_content(result)
@@ -160,122 +250,61 @@ def _format_genfrac(
 def _format_font_style(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        return formatter._format_node(node.arguments[0], add_spaces)
-    else:
-        return ""
-
-
-def _format_bold(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return f"**{content}**"
+    args = node.arguments
+    if args and args[0] is not None:
+        return formatter._format_node(args[0], add_spaces)
     else:
         return ""
 
 
-def _format_italic(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return f"_{content}_"
-    else:
-        return ""
-
-
-def _format_ceil_floor(
-    node: MacroNode,
-    formatter: Formatter,
-    ldelim: str,
-    rdelim: str,
-    add_spaces: bool = False,
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return f"{ldelim}{content}{rdelim}"
-    else:
-        return f"{ldelim}{rdelim}"
-
-
-def _format_boxed(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return content
-    else:
-        return ""
-
-
-def _format_accent(
-    node: MacroNode, formatter: Formatter, accent: str, add_spaces: bool = False
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return f"{content}{accent}"
-    else:
-        return accent
-
+# Cached so macros that render the same way share a single formatter.
+@lru_cache(maxsize=None)
+def _wrap_format(
+    left: str = "", right: str = "", empty: str = ""
+) -> Callable[[MacroNode, Formatter, bool], str]:
+    def _wrap_format_wrapper(
+        node: MacroNode, formatter: Formatter, add_spaces: bool = False
+    ) -> str:
+        args = node.arguments
+        if args and args[0] is not None:
+            return left + formatter._format_node(args[0], add_spaces) + right
+        else:
+            return empty
 
-def _format_cancel(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return f"~~{content}~~"  # Strikethrough for cancel
-    else:
-        return ""
+    return _wrap_format_wrapper
 
 
-def _format_mod(node: MacroNode, formatter: Formatter, add_spaces: bool = False) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return f" mod {content}"
-    else:
-        return " mod"
+_format_bold = _wrap_format("**", "**")
+_format_italic = _wrap_format("_", "_")
+_format_cancel = _wrap_format("~~", "~~")  # Strikethrough for cancel
+_format_ceil = _wrap_format("⌈", "⌉", "⌈⌉")
+_format_mod = _wrap_format(" mod ", "", " mod")
+_format_pmod = _wrap_format(" (mod ", ")", " (mod)")
 
 
-def _format_pmod(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return f" (mod {content})"
-    else:
-        return " (mod)"
+def _accent_format(accent: str) -> Callable[[MacroNode, Formatter, bool], str]:
+    return _wrap_format("", accent, accent)
 
 
 def _format_binom(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
-    if node.arguments and len(node.arguments) >= 2 and node.arguments[0] is not None and node.arguments[1] is not None:
-        n = formatter._format_node(node.arguments[0], add_spaces)
-        k = formatter._format_node(node.arguments[1], add_spaces)
+    args = node.arguments
+    if args and len(args) >= 2 and args[0] is not None and args[1] is not None:
+        n = formatter._format_node(args[0], add_spaces)
+        k = formatter._format_node(args[1], add_spaces)
         return f"C({n},{k})"
     else:
         return ""
 
 
-def _format_stackrel(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
-) -> str:
-    if node.arguments and len(node.arguments) >= 2 and node.arguments[0] is not None and node.arguments[1] is not None:
-        top = formatter._format_node(node.arguments[0], add_spaces)
-        bottom = formatter._format_node(node.arguments[1], add_spaces)
-        return f"{bottom}^{top}"
-    else:
-        return ""
-
-
 def _format_overset(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
-    if node.arguments and len(node.arguments) >= 2 and node.arguments[0] is not None and node.arguments[1] is not None:
-        top = formatter._format_node(node.arguments[0], add_spaces)
-        bottom = formatter._format_node(node.arguments[1], add_spaces)
+    args = node.arguments
+    if args and len(args) >= 2 and args[0] is not None and args[1] is not None:
+        top = formatter._format_node(args[0], add_spaces)
+        bottom = formatter._format_node(args[1], add_spaces)
         return f"{bottom}^{top}"
     else:
         return ""
@@ -284,20 +313,46 @@ def _format_overset(
 def _format_underset(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
-    if node.arguments and len(node.arguments) >= 2 and node.arguments[0] is not None and node.arguments[1] is not None:
-        bottom = formatter._format_node(node.arguments[0], add_spaces)
-        top = formatter._format_node(node.arguments[1], add_spaces)
+    args = node.arguments
+    if args and len(args) >= 2 and args[0] is not None and args[1] is not None:
+        bottom = formatter._format_node(args[0], add_spaces)
+        top = formatter._format_node(args[1], add_spaces)
         return f"{top}_{bottom}"
     else:
         return ""
 
 
+def _visible_length(node: Node, formatter: Formatter) -> Optional[int]:
+    # Width of a subtree made only of plain text and symbol macros, read off
+    # the tree without formatting it; None when it has to be formatted.
+    node_type = type(node)
+    if node_type is TextNode:
+        if node.subscript is None and node.superscript is None:
+            return len(node.content)
+    elif node_type is MacroNode:
+        symbol = formatter.formatters.get(node.name)
+        if type(symbol) is _ConstantFormat:
+            return len(symbol.text)
+    elif node_type is MultiNode:
+        total = 0
+        for child in formatter._skip_empty_text_node(node.content, node.type):
+            length = _visible_length(child, formatter)
+            if length is None:
+                return None
+            total += length
+        return total
+    return None
+
+
 def _format_phantom(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
-        return " " * len(content)
+    args = node.arguments
+    if args and args[0] is not None:
+        length = None if add_spaces else _visible_length(args[0], formatter)
+        if length is None:
+            length = len(formatter._format_node(args[0], add_spaces))
+        return " " * length
     else:
         return ""
 
@@ -305,54 +360,39 @@ def _format_phantom(
 def _format_textsuperscript(
     node: MacroNode, formatter: Formatter, add_spaces: bool = False
 ) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        content = formatter._format_node(node.arguments[0], add_spaces)
+    args = node.arguments
+    if args and args[0] is not None:
+        content = formatter._format_node(args[0], add_spaces)
         return formatter._format_superscript(content)
     else:
         return ""
 
 
-def _format_left_right(
-    node: MacroNode, formatter: Formatter, add_spaces: bool = False
-) -> str:
-    if node.arguments and node.arguments[0] is not None:
-        delimiter = formatter._format_node(node.arguments[0], add_spaces)
-        return delimiter
-    else:
-        return ""
+_ENVIRONMENT_DELIMITERS = {
+    "pmatrix": ("(", ")"),
+    "bmatrix": ("[", "]"),
+    "vmatrix": ("|", "|"),
+    "Vmatrix": ("‖", "‖"),
+    "cases": ("{", "}"),
+}
 
 
 def _format_environment(env_name: str, content: str) -> str:
-    cleaned_content = re.sub(r"\\\\\s*$", "", content.strip())
-    cleaned_content = re.sub(
-        r"\\\\\s*(?=\s*$)", "", cleaned_content, flags=re.MULTILINE
-    )
+    cleaned_content = _TRAILING_LINE_BREAK_RE.sub("", content.strip())
+    cleaned_content = _LINE_END_BREAK_RE.sub("", cleaned_content)
 
     cleaned_content = cleaned_content.replace("\\\\", "\n")
 
-    if env_name in {"matrix", "pmatrix", "bmatrix", "vmatrix", "Vmatrix", "array"}:
-        cleaned_content = re.sub(r"\s*&\s*", " ", cleaned_content)
-    elif env_name in {"align", "align*", "aligned"}:
-        cleaned_content = re.sub(r"\s*&\s*", " ", cleaned_content)
-    elif env_name in {"cases"}:
-        cleaned_content = re.sub(r"\s*&\s*", " if ", cleaned_content)
-    else:
-        cleaned_content = re.sub(r"\s*&\s*", " ", cleaned_content)
-
-    cleaned_content = re.sub(r" +", " ", cleaned_content).strip()
-
-    if env_name == "pmatrix":
-        return f"({cleaned_content})"
-    elif env_name == "bmatrix":
-        return f"[{cleaned_content}]"
-    elif env_name == "vmatrix":
-        return f"|{cleaned_content}|"
-    elif env_name == "Vmatrix":
-        return f"‖{cleaned_content}‖"
-    elif env_name == "cases":
-        return f"{{{cleaned_content}}}"
-    else:
-        return cleaned_content
+    cleaned_content = _ALIGNMENT_RE.sub(
+        " if " if env_name == "cases" else " ", cleaned_content
+    )
+
+    cleaned_content = _SPACES_RE.sub(" ", cleaned_content).strip()
+
+    delimiters = _ENVIRONMENT_DELIMITERS.get(env_name)
+    if delimiters is not None:
+        return delimiters[0] + cleaned_content + delimiters[1]
+    return cleaned_content
 
 
 DEFAULT_FORMATTERS = {
@@ -576,9 +616,9 @@ DEFAULT_FORMATTERS = {
     "multimap": _simple_format("⊸"),
     "leadsto": _simple_format("⤳"),
     "dashrightarrow": _simple_format("⇢"),
-    "xleftarrow": lambda n, f, a=False: _format_accent(n, f, "←", a),
-    "xrightarrow": lambda n, f, a=False: _format_accent(n, f, "→", a),
-    "xlongequal": lambda n, f, a=False: _format_accent(n, f, "=", a),
+    "xleftarrow": _accent_format("←"),
+    "xrightarrow": _accent_format("→"),
+    "xlongequal": _accent_format("="),
     # Binary operators
     "pm": _simple_format(["±", "+/-"], weights=[0.5, 0.5]),
     "mp": _simple_format(["∓", "-/"], weights=[0.5, 0.5]),
@@ -622,8 +662,8 @@ DEFAULT_FORMATTERS = {
     # Delimiters & Brackets
     "lfloor": _simple_format("⌊"),
     "rfloor": _simple_format("⌋"),
-    "lceil": lambda n, f, a=False: _format_ceil_floor(n, f, "⌈", "⌉", a),
-    "rceil": lambda n, f, a=False: _format_ceil_floor(n, f, "⌈", "⌉", a),
+    "lceil": _format_ceil,
+    "rceil": _format_ceil,
     "langle": _simple_format(["⟨", "<"], weights=[0.5, 0.5]),
     "rangle": _simple_format(["⟩", ">"], weights=[0.5, 0.5]),
     "lvert": _simple_format("|"),
@@ -632,8 +672,8 @@ DEFAULT_FORMATTERS = {
     "rVert": _simple_format("‖"),
     "vert": _simple_format("|"),
     "Vert": _simple_format("‖"),
-    "left": _format_left_right,
-    "right": _format_left_right,
+    "left": _format_font_style,
+    "right": _format_font_style,
     "brace": _simple_format("{...}"),
     "brack": _simple_format("[...]"),
     "lbrace": _simple_format("{"),
@@ -787,34 +827,34 @@ DEFAULT_FORMATTERS = {
     "smallskipamount": _simple_format(" "),
     "par": _simple_format("\n"),
     # Accents & Decorations
-    "hat": lambda n, f, a=False: _format_accent(n, f, "̂", a),
-    "widehat": lambda n, f, a=False: _format_accent(n, f, "̂", a),
-    "tilde": lambda n, f, a=False: _format_accent(n, f, "̃", a),
-    "widetilde": lambda n, f, a=False: _format_accent(n, f, "̃", a),
-    "bar": lambda n, f, a=False: _format_accent(n, f, "̄", a),
-    "overline": lambda n, f, a=False: _format_accent(n, f, "̄", a),
-    "vec": lambda n, f, a=False: _format_accent(n, f, "⃗", a),
-    "overrightarrow": lambda n, f, a=False: _format_accent(n, f, "⃗", a),
-    "overleftarrow": lambda n, f, a=False: _format_accent(n, f, "⃖", a),
-    "overleftrightarrow": lambda n, f, a=False: _format_accent(n, f, "↔", a),
-    "dot": lambda n, f, a=False: _format_accent(n, f, "̇", a),
-    "ddot": lambda n, f, a=False: _format_accent(n, f, "̈", a),
-    "dddot": lambda n, f, a=False: _format_accent(n, f, "⃛", a),
-    "ddddot": lambda n, f, a=False: _format_accent(n, f, "⃜", a),
-    "check": lambda n, f, a=False: _format_accent(n, f, "̌", a),
-    "grave": lambda n, f, a=False: _format_accent(n, f, "̀", a),
-    "breve": lambda n, f, a=False: _format_accent(n, f, "̆", a),
-    "mathring": lambda n, f, a=False: _format_accent(n, f, "̊", a),
+    "hat": _accent_format("̂"),
+    "widehat": _accent_format("̂"),
+    "tilde": _accent_format("̃"),
+    "widetilde": _accent_format("̃"),
+    "bar": _accent_format("̄"),
+    "overline": _accent_format("̄"),
+    "vec": _accent_format("⃗"),
+    "overrightarrow": _accent_format("⃗"),
+    "overleftarrow": _accent_format("⃖"),
+    "overleftrightarrow": _accent_format("↔"),
+    "dot": _accent_format("̇"),
+    "ddot": _accent_format("̈"),
+    "dddot": _accent_format("⃛"),
+    "ddddot": _accent_format("⃜"),
+    "check": _accent_format("̌"),
+    "grave": _accent_format("̀"),
+    "breve": _accent_format("̆"),
+    "mathring": _accent_format("̊"),
     "underline": _format_italic,  # Simple fallback
     "underbracket": _format_italic,
-    "overbrace": lambda n, f, a=False: _format_accent(n, f, "⏞", a),
-    "underbrace": lambda n, f, a=False: _format_accent(n, f, "⏟", a),
-    "overarc": lambda n, f, a=False: _format_accent(n, f, "⌒", a),
-    "overparen": lambda n, f, a=False: _format_accent(n, f, "⏠", a),
+    "overbrace": _accent_format("⏞"),
+    "underbrace": _accent_format("⏟"),
+    "overarc": _accent_format("⌒"),
+    "overparen": _accent_format("⏠"),
     "cancel": _format_cancel,
-    "boxed": _format_boxed,
-    "fbox": _format_boxed,
-    "framebox": _format_boxed,
+    "boxed": _format_font_style,
+    "fbox": _format_font_style,
+    "framebox": _format_font_style,
     # Binomial coefficients
     "binom": _format_binom,
     "dbinom": _format_binom,
@@ -855,7 +895,7 @@ DEFAULT_FORMATTERS = {
     "scr": _simple_format(""),
     "frak": _simple_format(""),
     "textsuperscript": _format_textsuperscript,
-    "textsubscript": lambda n, f, a=False: f"_{_format_font_style(n,f,a)}",
+    "textsubscript": _wrap_format("_", "", "_"),
     "textcircled": _format_font_style,
     "LaTeX": _simple_format("LaTeX"),
     "normalsize": _simple_format(""),
@@ -864,8 +904,8 @@ DEFAULT_FORMATTERS = {
     "endgroup": _simple_format(""),
     "endarray": _simple_format(""),
     "item": _simple_format("• "),
-    "title": lambda n, f, a=False: f"Title: {_format_font_style(n, f, a)}\n",
-    "author": lambda n, f, a=False: f"Author: {_format_font_style(n, f, a)}\n",
+    "title": _wrap_format("Title: ", "\n", "Title: \n"),
+    "author": _wrap_format("Author: ", "\n", "Author: \n"),
     "caption": _format_font_style,
     "label": _simple_format(""),
     "ref": _format_font_style,
@@ -882,7 +922,7 @@ DEFAULT_FORMATTERS = {
     "hphantom": _format_phantom,
     "vphantom": _simple_format(""),
     "mathstrut": _simple_format(""),
-    "stackrel": _format_stackrel,
+    "stackrel": _format_overset,
     "overset": _format_overset,
     "underset": _format_underset,
     "operatorname": _format_font_style,
@@ -914,7 +954,7 @@ DEFAULT_FORMATTERS = {
     "hline": _simple_format("\n---\n"),
     "hdashline": _simple_format("\n---\n"),
     "rule": _simple_format("---"),
-    "multicolumn": lambda n, f, a=False: f"{_format_font_style(n, f, a)}",
+    "multicolumn": _format_font_style,
     "substack": _format_font_style,
     "pmatrix": _format_font_style,
     "align": _format_font_style,
@@ -1110,95 +1150,69 @@ SPECIAL_SUPERSCRIPT_FORMAT = {
     "y": "ʸ",
     "z": "ᶻ",
 }
+# Superscripts made only of mappable characters are converted in one
+# translate call.
+_SUPERSCRIPT_CHARACTERS = frozenset(SPECIAL_SUPERSCRIPT_FORMAT)
+_SUPERSCRIPT_TRANSLATION = str.maketrans(SPECIAL_SUPERSCRIPT_FORMAT)
 
 
 class Formatter:
+    _DOCUMENT_CACHE_SIZE = 128
+
     def __init__(
         self,
-        formatters: Optional[Dict[str, Callable[[MacroNode, Formatter], str]]] = None,
+        formatters: Optional[
+            Dict[str, Union[str, Callable[[MacroNode, Formatter], str]]]
+        ] = None,
     ):
-        self.formatters = {**DEFAULT_FORMATTERS, **(formatters or {})}
+        if formatters:
+            # Plain strings are accepted as constant symbol formatters.
+            self.formatters = {
+                sys.intern(name): (
+                    _ConstantFormat(formatter)
+                    if isinstance(formatter, str)
+                    else formatter
+                )
+                for name, formatter in {**DEFAULT_FORMATTERS, **formatters}.items()
+            }
+        else:
+            # A shallow copy, so each instance's table can be edited on its own
+            self.formatters = dict(DEFAULT_FORMATTERS)
+        self._dispatch = {
+            TextNode: self._format_text_node,
+            MacroNode: self._format_macro_node,
+            EnvironmentNode: self._format_environment_node,
+        }
+        self._document_cache: OrderedDict[
+            Tuple[Tuple[int, ...], bool], Tuple[Tuple[Node, ...], str]
+        ] = OrderedDict()
 
     def _skip_empty_text_node(
         self, nodes: List[Node], node_type: str = ""
     ) -> List[Node]:
+        if node_type == "math":
+            # Explicit space macros are dropped in math mode as well
+            return [
+                node
+                for node in nodes
+                if node is not None
+                and not (type(node) is TextNode and not node.content)
+                and not (type(node) is MacroNode and node.name == " ")
+            ]
         return [
             node
             for node in nodes
-            if node is not None
-            and not (
-                (isinstance(node, TextNode) and not node.content)
-                or (
-                    node_type == "math"
-                    and isinstance(node, MacroNode)
-                    and node.name == " "
-                )
-            )
+            if node is not None and not (type(node) is TextNode and not node.content)
         ]
 
     def _add_spaces_to_content(self, content: str) -> str:
-        i = 0
-        result = []
-
-        no_space_before = {"(", "[", "{", "%"}
-        no_space_after = {")", "]", "}"}
-
-        while i < len(content):
-            char = content[i]
-
-            if char in BINARY_OPERATORS:
-                if result and result[-1] != " " and result[-1] not in no_space_before:
-                    result.append(" ")
-
-                result.append(char)
-
-                if (
-                    i + 1 < len(content)
-                    and content[i + 1] != " "
-                    and content[i + 1] not in no_space_after
-                ):
-                    result.append(" ")
-
-            elif char in no_space_before:
-                # Don't add spaces before parentheses, brackets, or braces
-                result.append(char)
-
-            elif char in no_space_after:
-                result.append(char)
-                if (
-                    i + 1 < len(content)
-                    and content[i + 1] not in BINARY_OPERATORS
-                    and content[i + 1] != " "
-                    and content[i + 1] not in no_space_after
-                ):
-                    if content[i + 1].isalnum():
-                        result.append(" ")
-
-            elif char == " ":
-                if not result or result[-1] != " ":
-                    result.append(char)
-
-            else:
-                result.append(char)
-
-            i += 1
-
-        return "".join(result)
+        return _add_spaces(content)
 
     def _format_superscript(self, superscript_content: str) -> str:
         content = superscript_content.strip()
-        
-        if content in SPECIAL_SUPERSCRIPT_FORMAT:
-            return SPECIAL_SUPERSCRIPT_FORMAT[content]
-        
-        result = ""
-        for char in content:
-            if char in SPECIAL_SUPERSCRIPT_FORMAT:
-                result += SPECIAL_SUPERSCRIPT_FORMAT[char]
-            else:
-                return "^" + content
-        
-        return result
+        if _SUPERSCRIPT_CHARACTERS.issuperset(content):
+            return content.translate(_SUPERSCRIPT_TRANSLATION)
+        return "^" + content
 
     def _format_text_node(self, node: TextNode, add_spaces: bool = False) -> str:
         output = node.content
@@ -1213,25 +1227,25 @@ class Formatter:
         return output
 
     def _format_macro_node(self, node: MacroNode, add_spaces: bool = False) -> str:
-        if node.name in self.formatters:
-            return self.formatters[node.name](node, self, add_spaces)
-        else:
+        formatter = self.formatters.get(node.name)
+        if formatter is None:
             raise ValueError(f"No formatter found for \\{node.name}")
-
-    def _format_multi_node(self, node: MultiNode, add_spaces: bool = False) -> str:
-        separator = " " if node.type == "math" and add_spaces else ""
-        return separator.join(
-            self._format_node(child, add_spaces)
-            for child in self._skip_empty_text_node(node.content, node.type)
-        )
+        if type(formatter) is _ConstantFormat:
+            return formatter.text
+        return formatter(node, self, add_spaces)
 
     def _format_environment_node(
         self, node: EnvironmentNode, add_spaces: bool = False
     ) -> str:
         # Format the content within the environment
+        # Empty text leaves are filtered inline rather than copied out first
         content = "".join(
-            self._format_node(child, add_spaces)
-            for child in self._skip_empty_text_node(node.content)
+            [
+                self._format_node(child, add_spaces)
+                for child in node.content
+                if child is not None
+                and not (type(child) is TextNode and not child.content)
+            ]
         )
 
         # Apply environment-specific formatting
@@ -1248,24 +1262,149 @@ class Formatter:
 
         return output
 
+    def _render(self, entries: List[Tuple[Node, bool]]) -> str:
+        """Format ``(node, add_spaces)`` entries into a single string.
+
+        Multi nodes are flattened onto an explicit stack instead of being
+        formatted recursively, and every fragment is appended to one list that
+        is joined once at the end.
+        """
+        parts = []
+        stack: List[Union[Tuple[Node, bool], str]] = entries[::-1]
+        formatters = self.formatters
+
+        while stack:
+            entry = stack.pop()
+            if type(entry) is str:
+                parts.append(entry)
+                continue
+
+            node, add_spaces = entry
+            node_type = type(node)
+            if node_type is MultiNode:
+                children = self._skip_empty_text_node(node.content, node.type)
+                separator = " " if node.type == "math" and add_spaces else ""
+                for i in range(len(children) - 1, -1, -1):
+                    stack.append((children[i], add_spaces))
+                    if i and separator:
+                        stack.append(separator)
+            elif (
+                node_type is TextNode
+                and not add_spaces
+                and node.subscript is None
+                and node.superscript is None
+            ):
+                parts.append(node.content)
+            elif node_type is MacroNode:
+                # Symbol macros are resolved straight from the table; only
+                # macros with real formatting logic cost a call.
+                formatter = formatters.get(node.name)
+                if formatter is None:
+                    raise ValueError(f"No formatter found for \\{node.name}")
+                if type(formatter) is _ConstantFormat:
+                    parts.append(formatter.text)
+                else:
+                    parts.append(formatter(node, self, add_spaces))
+            else:
+                handler = self._dispatch.get(node_type)
+                if handler is None:
+                    raise ValueError(f"Unknown node type: {node_type}")
+                parts.append(handler(node, add_spaces))
+
+        return "".join(parts)
+
     def _format_node(self, node: Node, add_spaces: bool = False) -> str:
-        if isinstance(node, TextNode):
-            return self._format_text_node(node, add_spaces)
-        elif isinstance(node, MacroNode):
-            return self._format_macro_node(node, add_spaces)
-        elif isinstance(node, MultiNode):
-            return self._format_multi_node(node, add_spaces)
-        elif isinstance(node, EnvironmentNode):
-            return self._format_environment_node(node, add_spaces)
-        else:
-            raise ValueError(f"Unknown node type: {type(node)}")
+        node_type = type(node)
+        handler = self._dispatch.get(node_type)
+        if handler is not None:
+            return handler(node, add_spaces)
+        if node_type is MultiNode:
+            children = self._skip_empty_text_node(node.content, node.type)
+            if not children:
+                return ""
+            if len(children) == 1:
+                return self._format_node(children[0], add_spaces)
+        return self._render([(node, add_spaces)])
 
     def format_nodes(self, nodes: List[Node], add_spaces: bool = False) -> str:
-        output = "".join(
-            self._format_node(
-                node, add_spaces and isinstance(node, MultiNode) and node.type == "math"
-            )
-            for node in self._skip_empty_text_node(nodes)
+        output = self._render(
+            [
+                (node, add_spaces and type(node) is MultiNode and node.type == "math")
+                for node in nodes
+                if node is not None
+                and not (type(node) is TextNode and not node.content)
+            ]
         )
         output = _clean_parentheses_spacing(output)
         return output
+
+    def format_nodes_cached(self, nodes: List[Node], add_spaces: bool = False) -> str:
+        """Like ``format_nodes``, but reuse the output for a node list seen before.
+
+        Lists are matched by the identity of their top-level nodes, so the
+        nodes must not be mutated between calls. A cached document also keeps
+        the output of its first render, including any randomly chosen
+        formatting.
+        """
+        key = (tuple(id(node) for node in nodes), add_spaces)
+        cached = self._document_cache.get(key)
+        if cached is not None:
+            self._document_cache.move_to_end(key)
+            return cached[1]
+
+        output = self.format_nodes(nodes, add_spaces)
+        # Keep the nodes alive with the entry so their ids cannot be reused.
+        self._document_cache[key] = (tuple(nodes), output)
+        if len(self._document_cache) > self._DOCUMENT_CACHE_SIZE:
+            self._document_cache.popitem(last=False)
+        return output
+
+    def format_batch(
+        self,
+        documents: List[List[Node]],
+        add_spaces: bool = False,
+        workers: Optional[int] = None,
+    ) -> List[str]:
+        """Format many parsed documents, optionally in a pool of processes.
+
+        With ``workers`` above 1 each worker builds its own instance of this
+        formatter's class from its custom formatters, so subclasses keep their
+        behaviour. The class must be importable and the custom formatters
+        picklable on platforms that spawn rather than fork worker processes.
+        """
+        if not workers or workers <= 1:
+            return [self.format_nodes(nodes, add_spaces) for nodes in documents]
+
+        overrides = {
+            name: formatter
+            for name, formatter in self.formatters.items()
+            if DEFAULT_FORMATTERS.get(name) is not formatter
+        }
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_batch_worker,
+            initargs=(type(self), overrides),
+        ) as executor:
+            return list(
+                executor.map(
+                    _format_batch_document,
+                    [(nodes, add_spaces) for nodes in documents],
+                    chunksize=max(1, len(documents) // (workers * 4)),
+                )
+            )
+
+
+_batch_formatter: Optional[Formatter] = None
+
+
+def _init_batch_worker(
+    formatter_class: type,
+    formatters: Dict[str, Callable[[MacroNode, Formatter], str]],
+) -> None:
+    global _batch_formatter
+    _batch_formatter = formatter_class(formatters)
+
+
+def _format_batch_document(document: Tuple[List[Node], bool]) -> str:
+    nodes, add_spaces = document
+    return _batch_formatter.format_nodes(nodes, add_spaces)
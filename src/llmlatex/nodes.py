@@ -1,22 +1,27 @@
 from __future__ import annotations
 
+import sys
 from dataclasses import dataclass
 from typing import List, Literal, Optional
 
+# Slotted nodes drop the per-instance __dict__ and make field access a fixed
+# offset load; dataclass only accepts slots=True from Python 3.10 onwards.
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+
+@dataclass(**_DATACLASS_OPTIONS)
 class Node:
     pass
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class TextNode(Node):
     content: str
     subscript: Optional[Node] = None
     superscript: Optional[Node] = None
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class MacroNode(Node):
     name: str
     arguments: Optional[List[Node]] = None
@@ -25,13 +30,13 @@ class MacroNode(Node):
     superscript: Optional[Node] = None
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class MultiNode(Node):
     content: List[Node]
     type: Literal["math", "any"] = "any"
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class EnvironmentNode(Node):
     name: str
     content: List[Node]
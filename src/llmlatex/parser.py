@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import re
-from typing import List, Set, Tuple, Optional
+import sys
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple, Optional
 
 from .commands import COMMANDS
 from .nodes import Node, TextNode, MacroNode, MultiNode, EnvironmentNode
@@ -18,6 +19,46 @@ MATH_DOUBLE_DOLLAR_PATTERN = r"\$\$([^$]+)\$\$"
 ENVIRONMENT_PATTERN = r"\\begin\{([^}]+)\}(.*?)\\end\{\1\}"
 LEFT_RIGHT_PATTERN = r"\\(left|right)(.)"
 
+# Token patterns in priority order: when several match at the same position
+# the first one listed wins.
+_TOKEN_PATTERNS = {
+    "environment": re.compile(ENVIRONMENT_PATTERN, re.DOTALL),
+    "left_right": re.compile(LEFT_RIGHT_PATTERN),
+    "macro": re.compile(MACRO_PATTERN),
+    "subscript": re.compile(SUBSCRIPT_PATTERN),
+    "superscript": re.compile(SUPERSCRIPT_PATTERN),
+    "math_inline": re.compile(MATH_INLINE_PATTERN),
+    "math_inline_paren": re.compile(MATH_INLINE_PAREN_PATTERN),
+    "math_display": re.compile(MATH_DISPLAY_PATTERN),
+    "math_double_dollar": re.compile(MATH_DOUBLE_DOLLAR_PATTERN),
+}
+# Every token starts with one of these characters.
+_TOKEN_START_RE = re.compile(r"[\\_^$\[]")
+_TRAILING_BACKSLASHES_RE = re.compile(r"\\+$")
+_BRACE_RE = re.compile(r"[{}]")
+# Short script and argument bodies such as "i", "n" or "k+1" recur constantly;
+# for parse results made only of plain text leaves, the leaf contents are kept
+# per parser and fresh nodes are built from them on a hit.
+_LEAF_CACHE_MAX_LENGTH = 64
+_LEAF_CACHE_SIZE = 4096
+_SHORTENED_NAME_CACHE_SIZE = 4096
+_SUBSCRIPT_RE = _TOKEN_PATTERNS["subscript"]
+_SUPERSCRIPT_RE = _TOKEN_PATTERNS["superscript"]
+# All token patterns as one alternation so the next token is found in a single
+# scan; lastgroup names the winner. The environment alternative comes first,
+# so its name is captured by group 2 and the backreference is renumbered.
+_ENVIRONMENT_TOKEN_PATTERN = ENVIRONMENT_PATTERN.replace(r"\1", r"\2")
+_TOKEN_RE = re.compile(
+    "|".join(
+        [f"(?P<environment>(?s:{_ENVIRONMENT_TOKEN_PATTERN}))"]
+        + [
+            f"(?P<{match_type}>{pattern.pattern})"
+            for match_type, pattern in _TOKEN_PATTERNS.items()
+            if match_type != "environment"
+        ]
+    )
+)
+
 
 SKIP_MACROS = {
     "def",
@@ -46,28 +87,94 @@ SKIP_MACROS = {
     "end",
 }
 
+# Commands whose arguments keep their spaces inside math
+TEXT_PRESERVING_COMMANDS = {
+    "text",
+    "mathrm",
+    "mathit",
+    "mathbf",
+    "mathsf",
+    "mathtt",
+    "mathcal",
+    "mathscr",
+    "mathfrak",
+    "textbf",
+    "textit",
+    "textrm",
+    "textsf",
+    "texttt",
+}
+
+# Split the command list once at import; parsers share it until extended.
+_VALID_COMMANDS = frozenset(COMMANDS.split()) | {" "}
+
 
 class Parser:
     def __init__(self):
-        self.valid_commands = set(COMMANDS.split())
-        self.valid_commands.add(" ")
+        self._valid_commands = _VALID_COMMANDS
+        self._leaf_cache: Dict[Tuple[str, bool], Tuple[str, ...]] = {}
+        self._shortened_names: Dict[str, Optional[str]] = {}
+
+    @property
+    def valid_commands(self) -> FrozenSet[str]:
+        """Command names recognised by this parser.
+
+        The set is frozen; extend it with ``add_command`` or assign a new one.
+        """
+        return self._valid_commands
+
+    @valid_commands.setter
+    def valid_commands(self, value: Iterable[str]) -> None:
+        self._valid_commands = frozenset(value)
+        # Both caches depend on the command set
+        self._leaf_cache.clear()
+        self._shortened_names.clear()
+
+    def add_command(self, name: str) -> None:
+        """Recognise ``name`` as a command in later parses."""
+        self.valid_commands = self._valid_commands | {name}
 
     def _find_valid_command_name(self, command_name: str) -> Optional[str]:
-        if command_name in self.valid_commands:
+        if command_name in self._valid_commands:
             return command_name
 
+        # Misspelled or glued names like "alphax" recur, so remember the
+        # prefix search result for each of them.
+        try:
+            return self._shortened_names[command_name]
+        except KeyError:
+            pass
+
+        valid_name = None
         for i in range(len(command_name) - 1, 0, -1):
             shortened_name = command_name[:i]
-            if shortened_name in self.valid_commands:
-                return shortened_name
+            if shortened_name in self._valid_commands:
+                valid_name = shortened_name
+                break
 
-        return None
+        if len(self._shortened_names) < _SHORTENED_NAME_CACHE_SIZE:
+            self._shortened_names[command_name] = valid_name
+        return valid_name
 
     def parse(self, text: str) -> List[Node]:
+        return self._parse(text, False)
+
+    def _parse(self, text: str, in_math: bool) -> List[Node]:
+        """Parse text, removing spaces from text nodes when in_math is set.
+
+        Inside math, arguments of text commands such as ``\\text`` and the
+        contents and scripts of environments keep their spaces.
+        """
         if not text:
             return []
 
-        text = re.sub(r"\\+$", "", text.strip())
+        cache_key = (text, in_math)
+        cached = self._leaf_cache.get(cache_key)
+        if cached is not None:
+            return [TextNode(content) for content in cached]
+        source = text
+
+        text = _TRAILING_BACKSLASHES_RE.sub("", text.strip())
 
         nodes = []
         position = 0
@@ -76,22 +183,26 @@ class Parser:
             next_match, match_type = self._find_next_match(text, position)
 
             if next_match is None:
+                # Scripts are tokens too, so none can follow in the rest of
+                # the text: it is a single plain text node.
                 remaining_text = text[position:]
                 if remaining_text:
-                    text_node, new_pos = self._parse_text_with_scripts(
-                        remaining_text, position, text
-                    )
-                    nodes.append(text_node)
+                    if in_math:
+                        remaining_text = remaining_text.replace(" ", "")
+                    nodes.append(TextNode(remaining_text))
                 break
 
-            match_start = position + next_match.start()
+            match_start = next_match.start()
+            match_end = next_match.end()
             if match_start > position:
                 text_content = text[position:match_start]
                 if text_content:
+                    if in_math:
+                        text_content = text_content.replace(" ", "")
                     text_node = TextNode(text_content)
                     # Check for scripts immediately after this text content
                     updated_node, new_pos = self._parse_scripts(
-                        text_node, text, match_start
+                        text_node, text, match_start, in_math
                     )
                     nodes.append(updated_node)
                     if new_pos > match_start:
@@ -100,27 +211,26 @@ class Parser:
                         continue
 
             if match_type == "macro":
-                node, consumed_length = self._parse_macro(next_match)
+                node, macro_end = self._parse_macro(next_match, in_math)
                 if node:
                     # Check for subscripts and superscripts after the macro
-                    # Use the actual consumed length instead of the full match end
-                    new_position = position + consumed_length
+                    # Use the actual consumed end instead of the full match end
                     updated_node, new_position = self._parse_scripts(
-                        node, text, new_position
+                        node, text, macro_end, in_math
                     )
                     nodes.append(updated_node)
                     position = new_position
                     continue
                 else:
-                    # Even if no node was created, we need to advance by the consumed length
-                    position = position + consumed_length
+                    # Even if no node was created, we need to advance past what was consumed
+                    position = macro_end
                     continue
             elif match_type == "subscript":
                 # This is a standalone subscript, we need to attach it to the previous node
                 if nodes:
-                    prev_node = nodes.pop()  # Remove the last node
+                    prev_node = nodes[-1]
                     subscript_content = next_match.group(1)
-                    subscript_nodes = self.parse(subscript_content)
+                    subscript_nodes = self._parse(subscript_content, in_math)
                     if len(subscript_nodes) == 1:
                         subscript_node = subscript_nodes[0]
                     elif len(subscript_nodes) > 1:
@@ -128,32 +238,15 @@ class Parser:
                     else:
                         subscript_node = None
 
-                    # Add subscript to previous node
+                    # Add subscript to previous node; other node types can't take scripts
                     if isinstance(prev_node, (MacroNode, TextNode)):
-                        if isinstance(prev_node, MacroNode):
-                            updated_node = MacroNode(
-                                name=prev_node.name,
-                                arguments=prev_node.arguments,
-                                optional_arguments=prev_node.optional_arguments,
-                                subscript=subscript_node,
-                                superscript=prev_node.superscript,
-                            )
-                        else:  # TextNode
-                            updated_node = TextNode(
-                                content=prev_node.content,
-                                subscript=subscript_node,
-                                superscript=prev_node.superscript,
-                            )
-                        nodes.append(updated_node)
-                    else:
-                        # Can't attach to this node type, put it back and continue
-                        nodes.append(prev_node)
+                        prev_node.subscript = subscript_node
             elif match_type == "superscript":
                 # This is a standalone superscript, we need to attach it to the previous node
                 if nodes:
-                    prev_node = nodes.pop()  # Remove the last node
+                    prev_node = nodes[-1]
                     superscript_content = next_match.group(1)
-                    superscript_nodes = self.parse(superscript_content)
+                    superscript_nodes = self._parse(superscript_content, in_math)
                     if len(superscript_nodes) == 1:
                         superscript_node = superscript_nodes[0]
                     elif len(superscript_nodes) > 1:
@@ -163,44 +256,25 @@ class Parser:
                     else:
                         superscript_node = None
 
-                    # Add superscript to previous node
+                    # Add superscript to previous node; other node types can't take scripts
                     if isinstance(prev_node, (MacroNode, TextNode)):
-                        if isinstance(prev_node, MacroNode):
-                            updated_node = MacroNode(
-                                name=prev_node.name,
-                                arguments=prev_node.arguments,
-                                optional_arguments=prev_node.optional_arguments,
-                                subscript=prev_node.subscript,
-                                superscript=superscript_node,
-                            )
-                        else:  # TextNode
-                            updated_node = TextNode(
-                                content=prev_node.content,
-                                subscript=prev_node.subscript,
-                                superscript=superscript_node,
-                            )
-                        nodes.append(updated_node)
-                    else:
-                        # Can't attach to this node type, put it back and continue
-                        nodes.append(prev_node)
+                        prev_node.superscript = superscript_node
             elif match_type in ["math_inline", "math_inline_paren", "math_display", "math_double_dollar"]:
                 node = self._parse_multi_node(next_match)
                 if node:
                     # Check for subscripts and superscripts after math blocks too
-                    new_position = position + next_match.end()
                     updated_node, new_position = self._parse_scripts(
-                        node, text, new_position
+                        node, text, match_end, in_math
                     )
                     nodes.append(updated_node)
                     position = new_position
                     continue
             elif match_type == "left_right":
-                node = self._parse_left_right_node(next_match)
+                node = self._parse_left_right_node(next_match, in_math)
                 if node:
                     # Check for subscripts and superscripts after left/right commands too
-                    new_position = position + next_match.end()
                     updated_node, new_position = self._parse_scripts(
-                        node, text, new_position
+                        node, text, match_end, in_math
                     )
                     nodes.append(updated_node)
                     position = new_position
@@ -209,136 +283,100 @@ class Parser:
                 node = self._parse_environment_node(next_match)
                 if node:
                     # Check for subscripts and superscripts after environment blocks too
-                    new_position = position + next_match.end()
                     updated_node, new_position = self._parse_scripts(
-                        node, text, new_position
+                        node, text, match_end, in_math
                     )
                     nodes.append(updated_node)
                     position = new_position
                     continue
 
-            position = position + next_match.end()
+            position = match_end
+
+        # Only the contents of script-free text leaves are kept, so callers
+        # never share node objects with the cache or with each other.
+        if (
+            len(source) <= _LEAF_CACHE_MAX_LENGTH
+            and len(self._leaf_cache) < _LEAF_CACHE_SIZE
+            and all(
+                type(node) is TextNode
+                and node.subscript is None
+                and node.superscript is None
+                for node in nodes
+            )
+        ):
+            self._leaf_cache[cache_key] = tuple(node.content for node in nodes)
 
         return nodes
 
     def _find_next_match(
         self, text: str, start_pos: int
     ) -> Tuple[Optional[re.Match], Optional[str]]:
-        matches = []
-        search_text = text[start_pos:]
-
-        # Look for environments FIRST with DOTALL flag to handle multiline content
-        # This needs higher priority than individual macros to prevent \begin from being parsed as a separate macro
-        environment_match = re.search(ENVIRONMENT_PATTERN, search_text, re.DOTALL)
-        if environment_match:
-            matches.append(
-                (
-                    start_pos + environment_match.start(),
-                    environment_match,
-                    "environment",
-                )
-            )
-
-        left_right_match = re.search(LEFT_RIGHT_PATTERN, search_text)
-        if left_right_match:
-            matches.append(
-                (start_pos + left_right_match.start(), left_right_match, "left_right")
-            )
-
-        macro_match = re.search(MACRO_PATTERN, search_text)
-        if macro_match:
-            matches.append((start_pos + macro_match.start(), macro_match, "macro"))
-
-        # Look for subscripts and superscripts (these should have higher priority than individual macros)
-        subscript_match = re.search(SUBSCRIPT_PATTERN, search_text)
-        if subscript_match:
-            matches.append(
-                (start_pos + subscript_match.start(), subscript_match, "subscript")
-            )
-
-        superscript_match = re.search(SUPERSCRIPT_PATTERN, search_text)
-        if superscript_match:
-            matches.append(
-                (
-                    start_pos + superscript_match.start(),
-                    superscript_match,
-                    "superscript",
-                )
-            )
-
-        math_inline_match = re.search(MATH_INLINE_PATTERN, search_text)
-        if math_inline_match:
-            content = math_inline_match.group(1)
-            
-            # Validate that this is a proper LaTeX equation, not a false positive
-            if self._is_valid_math_inline(math_inline_match, search_text):
-                matches.append(
-                    (
-                        start_pos + math_inline_match.start(),
-                        math_inline_match,
-                        "math_inline",
-                    )
-                )
-
-        math_inline_paren_match = re.search(MATH_INLINE_PAREN_PATTERN, search_text)
-        if math_inline_paren_match:
-            matches.append(
-                (
-                    start_pos + math_inline_paren_match.start(),
-                    math_inline_paren_match,
-                    "math_inline_paren",
-                )
-            )
-
-        math_display_match = re.search(MATH_DISPLAY_PATTERN, search_text)
-        if math_display_match:
-            matches.append(
-                (
-                    start_pos + math_display_match.start(),
-                    math_display_match,
-                    "math_display",
-                )
-            )
-
-        math_double_match = re.search(MATH_DOUBLE_DOLLAR_PATTERN, search_text)
-        if math_double_match:
-            # Validate that this is a proper LaTeX display equation
-            if self._is_valid_math_double_dollar(math_double_match):
-                matches.append(
-                    (
-                        start_pos + math_double_match.start(),
-                        math_double_match,
-                        "math_double_dollar",
-                    )
-                )
-
-        if not matches:
+        # Searching from start_pos keeps match offsets absolute and avoids
+        # copying the rest of the text for every token. Plain text is skipped
+        # with the single-character scan; the full alternation is only tried
+        # where a token could start.
+        candidate = _TOKEN_START_RE.search(text, start_pos)
+        while candidate is not None:
+            token_match = _TOKEN_RE.match(text, candidate.start())
+            if token_match is not None:
+                break
+            candidate = _TOKEN_START_RE.search(text, candidate.start() + 1)
+        else:
             return None, None
 
-        earliest = min(matches, key=lambda x: x[0])
-        return earliest[1], earliest[2]
+        match_type = token_match.lastgroup
+        match = _TOKEN_PATTERNS[match_type].match(text, token_match.start())
+        if self._is_valid_match(match, match_type, text):
+            return match, match_type
+
+        # The earliest candidate is a rejected $ or $$ block: fall back to
+        # searching each pattern on its own, leaving that pattern out.
+        # Ties go to the pattern listed first.
+        earliest, earliest_type = None, None
+        for other_type, pattern in _TOKEN_PATTERNS.items():
+            if other_type == match_type:
+                continue
+            other_match = pattern.search(text, start_pos)
+            if (
+                other_match
+                and (earliest is None or other_match.start() < earliest.start())
+                and self._is_valid_match(other_match, other_type, text)
+            ):
+                earliest, earliest_type = other_match, other_type
+
+        return earliest, earliest_type
+
+    def _is_valid_match(
+        self, match: re.Match, match_type: str, search_text: str
+    ) -> bool:
+        if match_type == "math_inline":
+            return self._is_valid_math_inline(match, search_text)
+        if match_type == "math_double_dollar":
+            return self._is_valid_math_double_dollar(match)
+        return True
 
-    def _parse_macro(self, match: re.Match) -> Tuple[Optional[Node], int]:
+    def _parse_macro(
+        self, match: re.Match, in_math: bool = False
+    ) -> Tuple[Optional[Node], int]:
         """
-        Parse a macro and return the node and the actual consumed length.
+        Parse a macro and return the node and the position parsing resumes at.
 
         Returns:
-            Tuple of (MacroNode, TextNode, or None, consumed_length)
-            where consumed_length is how many characters from the match were actually used.
+            Tuple of (MacroNode, TextNode, or None, end_position)
+            where end_position is the offset in the text just after what was actually used.
             Returns TextNode for special cases like newline followed by text.
         """
-        groups = match.groups()
-        if not groups or not groups[0]:
+        original_command_name = match.group(1)
+        if not original_command_name:
             return None, match.end()
 
-        original_command_name = groups[0]
-
         if (
             len(original_command_name) > 1
             and original_command_name[0] == "n"
-            and original_command_name not in self.valid_commands
+            and original_command_name not in self._valid_commands
         ):
-            return TextNode(f"\n {original_command_name[1:]}"), match.end()
+            separator = "" if in_math else " "
+            return TextNode(f"\n{separator}{original_command_name[1:]}"), match.end()
 
         # Find the longest valid command name by progressively shortening
         command_name = self._find_valid_command_name(original_command_name)
@@ -346,13 +384,15 @@ class Parser:
         if not command_name or command_name in SKIP_MACROS:
             return None, match.end()
 
+        # Interned names let formatter table lookups compare by identity
+        command_name = sys.intern(command_name)
+
         # Calculate how much of the original match we actually consumed
         if len(command_name) < len(original_command_name):
-            # We shortened the command, so we need to adjust the consumed length
-            # The match starts with \commandname, so we need to account for the backslash
-            consumed_length = len(command_name) + 1  # +1 for the backslash
+            # We shortened the command, so only \commandname itself is consumed
+            end_position = match.start() + len(command_name) + 1  # +1 for the backslash
         else:
-            consumed_length = match.end()
+            end_position = match.end()
 
         # For shortened commands, we only parse arguments from the valid command part
         if len(command_name) < len(original_command_name):
@@ -362,16 +402,15 @@ class Parser:
         else:
             full_match = match.group(0)
 
-        optional_args = []
-        optional_matches = re.findall(r"\[([^\]]*)\]", full_match)
-        if optional_matches:
-            optional_args = optional_matches
+        optional_args, brace_args = self._extract_arguments(full_match)
+
+        # Text commands keep the spaces of their arguments even inside math
+        in_math = in_math and command_name not in TEXT_PRESERVING_COMMANDS
 
         required_args = []
-        brace_args = self._extract_brace_arguments(full_match)
         for arg_text in brace_args:
             if arg_text:
-                arg_nodes = self.parse(arg_text)
+                arg_nodes = self._parse(arg_text, in_math)
                 if len(arg_nodes) == 1:
                     required_args.append(arg_nodes[0])
                 elif len(arg_nodes) > 1:
@@ -385,77 +424,53 @@ class Parser:
             arguments=required_args if required_args else None,
         )
 
-        return node, consumed_length
+        return node, end_position
 
-    def _extract_brace_arguments(self, text: str) -> List[str]:
-        arguments = []
-        i = 0
-        while i < len(text):
-            if text[i] == "{":
-                brace_count = 1
-                start = i + 1
-                i += 1
-                while i < len(text) and brace_count > 0:
-                    if text[i] == "{":
-                        brace_count += 1
-                    elif text[i] == "}":
-                        brace_count -= 1
-                    i += 1
-
-                if brace_count == 0:
-                    argument = text[start : i - 1]
-                    arguments.append(argument)
-                else:
-                    break
-            else:
-                i += 1
-
-        return arguments
-
-    def _parse_text_with_scripts(
-        self, text_content: str, start_pos: int, full_text: str
-    ) -> Tuple[TextNode, int]:
-        """Parse text content and check for scripts that might follow."""
-        # For the remaining text case, we need to check if any part of it has scripts
-        # Look for the first occurrence of a script pattern
-        script_pos = len(text_content)
-
-        # Find the earliest script in the text content
-        for pattern in [SUBSCRIPT_PATTERN, SUPERSCRIPT_PATTERN]:
-            match = re.search(pattern, text_content)
-            if match:
-                script_pos = min(script_pos, match.start())
-
-        if script_pos < len(text_content):
-            # Found a script, split the text
-            pure_text = text_content[:script_pos]
-            text_node = TextNode(pure_text)
-
-            # Parse scripts starting from the script position
-            updated_node, new_pos = self._parse_scripts(
-                text_node, full_text, start_pos + script_pos
-            )
-            return updated_node, new_pos
-        else:
-            # No scripts found, return simple text node
-            return TextNode(text_content), start_pos + len(text_content)
+    def _extract_arguments(self, text: str) -> Tuple[List[str], List[str]]:
+        """Return the ``[...]`` and ``{...}`` argument bodies of a macro match."""
+        optional_arguments = []
+        start = text.find("[")
+        while start != -1:
+            end = text.find("]", start + 1)
+            if end == -1:
+                break
+            optional_arguments.append(text[start + 1 : end])
+            start = text.find("[", end + 1)
 
-    def _parse_scripts(self, node: Node, text: str, position: int) -> Tuple[Node, int]:
+        # Jump from brace to brace instead of stepping through every character
+        arguments = []
+        depth = 0
+        start = 0
+        for brace in _BRACE_RE.finditer(text):
+            if brace.group() == "{":
+                if depth == 0:
+                    start = brace.end()
+                depth += 1
+            elif depth:
+                depth -= 1
+                if depth == 0:
+                    arguments.append(text[start : brace.start()])
+
+        return optional_arguments, arguments
+
+    def _parse_scripts(
+        self, node: Node, text: str, position: int, in_math: bool = False
+    ) -> Tuple[Node, int]:
         """Parse subscripts and superscripts that may follow a node."""
         current_pos = position
         updated_node = node
+        # Environments are kept verbatim inside math, scripts included
+        in_math = in_math and not isinstance(node, EnvironmentNode)
 
         # Keep looking for scripts until we don't find any more
         while current_pos < len(text):
-            remaining_text = text[current_pos:]
-
             # Check for subscript
-            subscript_match = re.match(SUBSCRIPT_PATTERN, remaining_text)
+            subscript_match = _SUBSCRIPT_RE.match(text, current_pos)
             if subscript_match:
                 subscript_content = subscript_match.group(1)
                 if subscript_content:
                     # Parse the subscript content
-                    subscript_nodes = self.parse(subscript_content)
+                    subscript_nodes = self._parse(subscript_content, in_math)
                     if len(subscript_nodes) == 1:
                         subscript_node = subscript_nodes[0]
                     elif len(subscript_nodes) > 1:
@@ -463,42 +478,23 @@ class Parser:
                     else:
                         subscript_node = None
 
-                    # Create new node with subscript based on type
-                    if isinstance(updated_node, MacroNode):
-                        updated_node = MacroNode(
-                            name=updated_node.name,
-                            arguments=updated_node.arguments,
-                            optional_arguments=updated_node.optional_arguments,
-                            subscript=subscript_node,
-                            superscript=updated_node.superscript,
-                        )
-                    elif isinstance(updated_node, TextNode):
-                        updated_node = TextNode(
-                            content=updated_node.content,
-                            subscript=subscript_node,
-                            superscript=updated_node.superscript,
-                        )
-                    elif isinstance(updated_node, EnvironmentNode):
-                        updated_node = EnvironmentNode(
-                            name=updated_node.name,
-                            content=updated_node.content,
-                            subscript=subscript_node,
-                            superscript=updated_node.superscript,
-                        )
+                    # Nodes are freshly built by the caller, so attach in place
+                    if isinstance(updated_node, (MacroNode, TextNode, EnvironmentNode)):
+                        updated_node.subscript = subscript_node
                     # For other node types, we can't add scripts directly
                     else:
                         break
 
-                    current_pos += subscript_match.end()
+                    current_pos = subscript_match.end()
                     continue
 
             # Check for superscript
-            superscript_match = re.match(SUPERSCRIPT_PATTERN, remaining_text)
+            superscript_match = _SUPERSCRIPT_RE.match(text, current_pos)
             if superscript_match:
                 superscript_content = superscript_match.group(1)
                 if superscript_content:
                     # Parse the superscript content
-                    superscript_nodes = self.parse(superscript_content)
+                    superscript_nodes = self._parse(superscript_content, in_math)
                     if len(superscript_nodes) == 1:
                         superscript_node = superscript_nodes[0]
                     elif len(superscript_nodes) > 1:
@@ -508,33 +504,14 @@ class Parser:
                     else:
                         superscript_node = None
 
-                    # Create new node with superscript based on type
-                    if isinstance(updated_node, MacroNode):
-                        updated_node = MacroNode(
-                            name=updated_node.name,
-                            arguments=updated_node.arguments,
-                            optional_arguments=updated_node.optional_arguments,
-                            subscript=updated_node.subscript,
-                            superscript=superscript_node,
-                        )
-                    elif isinstance(updated_node, TextNode):
-                        updated_node = TextNode(
-                            content=updated_node.content,
-                            subscript=updated_node.subscript,
-                            superscript=superscript_node,
-                        )
-                    elif isinstance(updated_node, EnvironmentNode):
-                        updated_node = EnvironmentNode(
-                            name=updated_node.name,
-                            content=updated_node.content,
-                            subscript=updated_node.subscript,
-                            superscript=superscript_node,
-                        )
+                    # Nodes are freshly built by the caller, so attach in place
+                    if isinstance(updated_node, (MacroNode, TextNode, EnvironmentNode)):
+                        updated_node.superscript = superscript_node
                     # For other node types, we can't add scripts directly
                     else:
                         break
 
-                    current_pos += superscript_match.end()
+                    current_pos = superscript_match.end()
                     continue
 
             # No more scripts found
@@ -542,194 +519,19 @@ class Parser:
 
         return updated_node, current_pos
 
-    def _remove_spaces_from_math_nodes(self, nodes: List[Node]) -> List[Node]:
-        """Recursively remove spaces from text nodes within math content, but preserve spaces in text commands."""
-        processed_nodes = []
-
-        for node in nodes:
-            if isinstance(node, TextNode):
-                # Remove spaces from text content
-                cleaned_content = node.content.replace(" ", "")
-
-                # Process subscript and superscript if they exist
-                cleaned_subscript = None
-                cleaned_superscript = None
-
-                if node.subscript:
-                    cleaned_subscript = self._remove_spaces_from_single_node(
-                        node.subscript
-                    )
-
-                if node.superscript:
-                    cleaned_superscript = self._remove_spaces_from_single_node(
-                        node.superscript
-                    )
-
-                processed_nodes.append(
-                    TextNode(
-                        content=cleaned_content,
-                        subscript=cleaned_subscript,
-                        superscript=cleaned_superscript,
-                    )
-                )
-
-            elif isinstance(node, MacroNode):
-                # Check if this is a text-preserving command
-                text_preserving_commands = {
-                    "text",
-                    "mathrm",
-                    "mathit",
-                    "mathbf",
-                    "mathsf",
-                    "mathtt",
-                    "mathcal",
-                    "mathscr",
-                    "mathfrak",
-                    "textbf",
-                    "textit",
-                    "textrm",
-                    "textsf",
-                    "texttt",
-                }
-
-                # Process macro arguments - preserve spaces for text commands
-                cleaned_arguments = None
-                if node.arguments:
-                    if node.name in text_preserving_commands:
-                        # For text commands, don't remove spaces from arguments
-                        cleaned_arguments = node.arguments
-                    else:
-                        # For other commands, recursively process
-                        cleaned_arguments = self._remove_spaces_from_math_nodes(
-                            node.arguments
-                        )
-
-                # Process subscript and superscript if they exist
-                cleaned_subscript = None
-                cleaned_superscript = None
-
-                if node.subscript:
-                    cleaned_subscript = self._remove_spaces_from_single_node(
-                        node.subscript
-                    )
-
-                if node.superscript:
-                    cleaned_superscript = self._remove_spaces_from_single_node(
-                        node.superscript
-                    )
-
-                processed_nodes.append(
-                    MacroNode(
-                        name=node.name,
-                        arguments=cleaned_arguments,
-                        optional_arguments=node.optional_arguments,
-                        subscript=cleaned_subscript,
-                        superscript=cleaned_superscript,
-                    )
-                )
-
-            elif isinstance(node, MultiNode):
-                # Recursively process multi-node content
-                cleaned_content = self._remove_spaces_from_math_nodes(node.content)
-                processed_nodes.append(
-                    MultiNode(content=cleaned_content, type=node.type)
-                )
-            else:
-                # For other node types, keep as is
-                processed_nodes.append(node)
-
-        return processed_nodes
-
-    def _remove_spaces_from_single_node(self, node: Node) -> Node:
-        """Helper to remove spaces from a single node, preserving spaces in text commands."""
-        if isinstance(node, TextNode):
-            cleaned_content = node.content.replace(" ", "")
-
-            cleaned_subscript = None
-            cleaned_superscript = None
-
-            if node.subscript:
-                cleaned_subscript = self._remove_spaces_from_single_node(node.subscript)
-
-            if node.superscript:
-                cleaned_superscript = self._remove_spaces_from_single_node(
-                    node.superscript
-                )
-
-            return TextNode(
-                content=cleaned_content,
-                subscript=cleaned_subscript,
-                superscript=cleaned_superscript,
-            )
-
-        elif isinstance(node, MacroNode):
-            # Check if this is a text-preserving command
-            text_preserving_commands = {
-                "text",
-                "mathrm",
-                "mathit",
-                "mathbf",
-                "mathsf",
-                "mathtt",
-                "mathcal",
-                "mathscr",
-                "mathfrak",
-                "textbf",
-                "textit",
-                "textrm",
-                "textsf",
-                "texttt",
-            }
-
-            cleaned_arguments = None
-            if node.arguments:
-                if node.name in text_preserving_commands:
-                    # For text commands, don't remove spaces from arguments
-                    cleaned_arguments = node.arguments
-                else:
-                    # For other commands, recursively process
-                    cleaned_arguments = self._remove_spaces_from_math_nodes(
-                        node.arguments
-                    )
-
-            cleaned_subscript = None
-            cleaned_superscript = None
-
-            if node.subscript:
-                cleaned_subscript = self._remove_spaces_from_single_node(node.subscript)
-
-            if node.superscript:
-                cleaned_superscript = self._remove_spaces_from_single_node(
-                    node.superscript
-                )
-
-            return MacroNode(
-                name=node.name,
-                arguments=cleaned_arguments,
-                optional_arguments=node.optional_arguments,
-                subscript=cleaned_subscript,
-                superscript=cleaned_superscript,
-            )
-
-        elif isinstance(node, MultiNode):
-            cleaned_content = self._remove_spaces_from_math_nodes(node.content)
-            return MultiNode(content=cleaned_content, type=node.type)
-        else:
-            return node
-
     def _parse_multi_node(self, match: re.Match) -> Optional[MultiNode]:
-        groups = match.groups()
-        if not groups or not groups[0]:
+        math_content = match.group(1)
+        if not math_content:
             return None
 
-        math_content = groups[0].strip()
+        math_content = math_content.strip()
         if not math_content:
             return None
 
-        content_nodes = self.parse(math_content)
-        processed_nodes = self._remove_spaces_from_math_nodes(content_nodes)
+        # Spaces are dropped from math text while it is parsed
+        content_nodes = self._parse(math_content, True)
 
-        return MultiNode(content=processed_nodes, type="math")
+        return MultiNode(content=content_nodes, type="math")
 
     def _parse_environment_node(self, match: re.Match) -> Optional[EnvironmentNode]:
         groups = match.groups()
@@ -750,13 +552,17 @@ class Parser:
 
         return EnvironmentNode(name=env_name, content=content_nodes)
 
-    def _parse_left_right_node(self, match: re.Match) -> Optional[MacroNode]:
+    def _parse_left_right_node(
+        self, match: re.Match, in_math: bool = False
+    ) -> Optional[MacroNode]:
         groups = match.groups()
         if not groups or len(groups) < 2:
             return None
 
         command_name = groups[0]  # "left" or "right"
         delimiter = groups[1]     # the delimiter character
+        if in_math:
+            delimiter = delimiter.replace(" ", "")
 
         # Create a text node for the delimiter
         delimiter_node = TextNode(content=delimiter)
@@ -805,51 +611,40 @@ class Parser:
         return True
 
 
-def _collect_macro_names(node: Node) -> set[str]:
+def _collect_macro_names(nodes: List[Node]) -> Set[str]:
+    # Walk the tree with an explicit stack so deep documents neither recurse
+    # nor build a set per node.
     macro_names = set()
+    stack = list(nodes)
 
-    if isinstance(node, MacroNode):
-        macro_names.add(node.name)
-
-        if node.arguments:
-            for arg_node in node.arguments:
-                macro_names.update(_collect_macro_names(arg_node))
-
-        if node.subscript:
-            macro_names.update(_collect_macro_names(node.subscript))
-
-        if node.superscript:
-            macro_names.update(_collect_macro_names(node.superscript))
-
-    elif isinstance(node, MultiNode):
-        for content_node in node.content:
-            macro_names.update(_collect_macro_names(content_node))
-
-    elif isinstance(node, TextNode):
-        if node.subscript:
-            macro_names.update(_collect_macro_names(node.subscript))
+    while stack:
+        node = stack.pop()
 
-        if node.superscript:
-            macro_names.update(_collect_macro_names(node.superscript))
-
-    elif isinstance(node, EnvironmentNode):
-        for content_node in node.content:
-            macro_names.update(_collect_macro_names(content_node))
-
-        if node.subscript:
-            macro_names.update(_collect_macro_names(node.subscript))
+        if isinstance(node, MacroNode):
+            macro_names.add(node.name)
+            if node.arguments:
+                stack.extend(node.arguments)
+        elif isinstance(node, (MultiNode, EnvironmentNode)):
+            stack.extend(node.content)
+        elif not isinstance(node, TextNode):
+            continue
 
-        if node.superscript:
-            macro_names.update(_collect_macro_names(node.superscript))
+        if not isinstance(node, MultiNode):
+            if node.subscript:
+                stack.append(node.subscript)
+            if node.superscript:
+                stack.append(node.superscript)
 
     return macro_names
 
 
-def enumerate_macros(text: str) -> Set[str]:
-    nodes = Parser().parse(text)
+_default_parser: Optional[Parser] = None
 
-    all_macro_names = set()
-    for node in nodes:
-        all_macro_names.update(_collect_macro_names(node))
 
-    return all_macro_names
+def enumerate_macros(text: str) -> Set[str]:
+    # Parsing keeps no per-document state on the parser, so one instance is
+    # reused and its caches carry over between calls.
+    global _default_parser
+    if _default_parser is None:
+        _default_parser = Parser()
+    return _collect_macro_names(_default_parser.parse(text))